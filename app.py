@@ -1,6 +1,12 @@
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, case, delete, event, func, insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import orjson
 import os
 
 app = Flask(__name__)
@@ -8,16 +14,40 @@ app.config['SECRET_KEY'] = 'replace-with-your-secret-key'
 basedir = os.path.abspath(os.path.dirname(__file__))
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'soccer.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Use Redis when CACHE_REDIS_URL is set (e.g. redis://localhost:6379/0), otherwise an in-process cache
+app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+app.config['CACHE_TYPE'] = 'RedisCache' if app.config['CACHE_REDIS_URL'] else 'SimpleCache'
+app.config['CACHE_DEFAULT_TIMEOUT'] = 60
 
 db = SQLAlchemy(app)
+cache = Cache(app)
 
-# Event types for outfield and keeper
+# Cache keys for the aggregate views; cleared whenever events or goals change
+STATS_CACHE_KEYS = ('view/stats', 'view/api_stats')
+
+def invalidate_stats_cache():
+    cache.delete_many(*STATS_CACHE_KEYS)
+
+def has_pending_flashes():
+    # never cache (or serve from cache) a page that renders flashed messages
+    return '_flashes' in session
+
+# Event types for outfield and keeper (tuples keep the form's option order)
 OUTFIELD_TYPES = ('shot', 'goal', 'assist', 'pass')
 KEEPER_TYPES = ('shot_on_goal_against', 'save', 'concede')
+# valid event types per position, as hashed lookups for validating submitted values
+ALLOWED_EVENT_TYPES = {'field': frozenset(OUTFIELD_TYPES), 'keeper': frozenset(KEEPER_TYPES)}
 
 class Event(db.Model):
+    __table_args__ = (
+        # covers the grouped counts in event_counts() so SQLite never touches the table
+        db.Index('ix_event_pos_type_target_scored', 'position', 'event_type', 'on_target', 'scored'),
+        # recent-events listing and date-range filters
+        db.Index('ix_event_ts_pos', 'timestamp', 'position'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    timestamp = db.Column(db.DateTime, server_default=func.now(), nullable=False)  # stamped by the DB on insert
     position = db.Column(db.String(20), nullable=False)  # 'field' or 'keeper'
     event_type = db.Column(db.String(40), nullable=False)
     # For shot events, we allow extra info (on_target, scored). Stored as booleans in columns for simplicity:
@@ -32,21 +62,171 @@ class TrainingGoal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     metric = db.Column(db.String(50), nullable=False)  # e.g., "goals_per_week", "save_percentage"
     target = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=func.now())
 
     def __repr__(self):
         return f"<Goal {self.metric} -> {self.target}>"
 
-# Initialize DB helper
-# @app.before_first_request
-with app.app_context():
-    def create_tables():
-        db.create_all()
+class DailyStat(db.Model):
+    # Per-day totals, updated together with each new Event so charts don't re-scan the events table
+    date = db.Column(db.Date, primary_key=True)
+    goals = db.Column(db.Integer, default=0, nullable=False)
+    shots = db.Column(db.Integer, default=0, nullable=False)
+    saves = db.Column(db.Integer, default=0, nullable=False)
+    shots_against = db.Column(db.Integer, default=0, nullable=False)
+
+    # (position, event_type) pairs that record() counts; other events never create a row
+    COUNTED_EVENTS = frozenset({('field', 'shot'), ('field', 'goal'),
+                                ('keeper', 'save'), ('keeper', 'shot_on_goal_against')})
+
+    def record(self, position, event_type, scored):
+        """Count one new event towards this day's totals."""
+        if position == 'field':
+            if event_type == 'shot':
+                self.shots = (self.shots or 0) + 1
+            if event_type == 'goal' or (event_type == 'shot' and scored):
+                self.goals = (self.goals or 0) + 1
+        elif event_type == 'save':
+            self.saves = (self.saves or 0) + 1
+        elif event_type == 'shot_on_goal_against':
+            self.shots_against = (self.shots_against or 0) + 1
+
+    def __repr__(self):
+        return f"<DailyStat {self.date} goals={self.goals} shots={self.shots}>"
+
+# SQL predicates shared by the aggregate queries below
+IS_FIELD_SHOT = and_(Event.position == 'field', Event.event_type == 'shot')
+IS_FIELD_GOAL = and_(Event.position == 'field',
+                     or_(Event.event_type == 'goal', and_(Event.event_type == 'shot', Event.scored)))
+IS_FIELD_ASSIST = and_(Event.position == 'field', Event.event_type == 'assist')
+IS_KEEPER_SAVE = and_(Event.position == 'keeper', Event.event_type == 'save')
+IS_KEEPER_SHOT_AGAINST = and_(Event.position == 'keeper', Event.event_type == 'shot_on_goal_against')
+
+def event_counts():
+    """
+    Aggregate all events in a single GROUP BY query.
+    Returns three Counters keyed by (position, event_type): event count, on-target count and
+    scored count. Pairs with no events read as 0.
+    """
+    rows = db.session.query(Event.position, Event.event_type,
+                            func.count(),
+                            func.sum(case((Event.on_target, 1), else_=0)),
+                            func.sum(case((Event.scored, 1), else_=0))
+                            ).group_by(Event.position, Event.event_type).all()
+    counts, on_target, scored = Counter(), Counter(), Counter()
+    for pos, et, n, ot, sc in rows:
+        counts[pos, et] = n
+        on_target[pos, et] = ot
+        scored[pos, et] = sc
+    return counts, on_target, scored
+
+def rebuild_daily_stats():
+    """Recompute the DailyStat table from the events table (INSERT ... SELECT, grouped by day)."""
+    day = func.date(Event.timestamp)
+    db.session.execute(delete(DailyStat))
+    db.session.execute(insert(DailyStat).from_select(
+        ['date', 'goals', 'shots', 'saves', 'shots_against'],
+        select(day,
+               func.count(case((IS_FIELD_GOAL, 1))),
+               func.count(case((IS_FIELD_SHOT, 1))),
+               func.count(case((IS_KEEPER_SAVE, 1))),
+               func.count(case((IS_KEEPER_SHOT_AGAINST, 1)))
+               ).where(or_(IS_FIELD_GOAL, IS_FIELD_SHOT, IS_KEEPER_SAVE, IS_KEEPER_SHOT_AGAINST)
+               ).group_by(day)))
+    db.session.commit()
+
+def bulk_add_events(rows):
+    """
+    Insert many events at once (e.g. an import). `rows` is a list of dicts keyed by Event column name;
+    leave out 'timestamp' to have the database stamp the row.
+    All rows go through a single executemany INSERT without the ORM unit of work; the /add form
+    keeps using the ORM path in add_event() for flash messages.
+    Raises ValueError, before anything is written, if a row has an unknown position or event type.
+    """
+    if not rows:
+        return
+    today = datetime.utcnow().date()
+    days = {}
+    for row in rows:
+        position, event_type = row.get('position'), row.get('event_type')
+        if event_type not in ALLOWED_EVENT_TYPES.get(position, ()):
+            raise ValueError(f'Invalid event: position={position!r} event_type={event_type!r}')
+        if (position, event_type) in DailyStat.COUNTED_EVENTS:
+            ts = row.get('timestamp')
+            day = ts.date() if ts is not None else today
+            if day not in days:
+                days[day] = DailyStat(date=day, goals=0, shots=0, saves=0, shots_against=0)
+            days[day].record(position, event_type, row.get('scored'))
+
+    db.session.execute(insert(Event), rows)
+    if days:
+        # add this batch's per-day totals to the existing rows; only the touched days are written
+        counters = ('goals', 'shots', 'saves', 'shots_against')
+        stmt = sqlite_insert(DailyStat).values(
+            [{'date': d.date, **{c: getattr(d, c) for c in counters}} for d in days.values()])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyStat.date],
+            set_={c: getattr(DailyStat, c) + getattr(stmt.excluded, c) for c in counters})
+        db.session.execute(stmt)
+    db.session.commit()
+    invalidate_stats_cache()
+
+def set_sqlite_pragmas(dbapi_conn, connection_record):
+    # WAL lets /stats readers run while /add commits; the rest keeps the working set in memory
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    cur.execute("PRAGMA cache_size=-65536")  # 64 MB
+    cur.execute("PRAGMA wal_autocheckpoint=1000")
+    cur.close()
+
+def add_missing_server_defaults(model):
+    """
+    SQLite can't change a column's default in place, so a table created before its columns had
+    server defaults is rebuilt: renamed, recreated from the model, and its rows copied across.
+    All steps share one transaction, so a failure leaves the original table as it was.
+    """
+    table = model.__table__
+    old_name = f'{table.name}_old'
+    with db.engine.begin() as conn:
+        existing = {c['name']: c for c in db.inspect(conn).get_columns(table.name)}
+        if all(col.server_default is None or (col.name in existing and existing[col.name]['default'] is not None)
+               for col in table.columns):
+            return
+        # pysqlite runs DDL in autocommit unless a transaction is already open, so open one explicitly
+        conn.exec_driver_sql('BEGIN')
+        conn.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old_name}')
+        for index in table.indexes:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS {index.name}')
+        table.create(conn)
+        # copy the columns both tables share; anything else takes its default in the new table
+        names = ', '.join(col.name for col in table.columns if col.name in existing)
+        conn.exec_driver_sql(f'INSERT INTO {table.name} ({names}) SELECT {names} FROM {old_name}')
+        conn.exec_driver_sql(f'DROP TABLE {old_name}')
+
+# Initialize DB helper (called once at startup, see the bottom of this file)
+def create_tables():
+    db.create_all()
+    if db.engine.dialect.name == 'sqlite':
+        for model in (Event, TrainingGoal):
+            add_missing_server_defaults(model)
+    # create_all() skips tables that already exist, so add any indexes they are missing
+    for index in Event.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    # backfill daily totals for databases that had events before DailyStat existed
+    if DailyStat.query.first() is None and Event.query.first() is not None:
+        rebuild_daily_stats()
 
 # Home / quick add links
 @app.route('/')
 def index():
-    latest = Event.query.order_by(Event.timestamp.desc()).limit(6).all()
+    # only the columns the list shows; rows come back as named tuples rather than Event objects.
+    # Timestamps have one-second resolution, so id breaks ties between events added in the same second.
+    latest = Event.query.with_entities(Event.timestamp, Event.position, Event.event_type,
+                                       Event.on_target, Event.scored
+                                       ).order_by(Event.timestamp.desc(), Event.id.desc()).limit(6).all()
     return render_template('index.html', latest=latest)
 
 # Add event form & processing
@@ -60,20 +240,24 @@ def add_event():
         scored = request.form.get('scored') == 'yes'
 
         # Basic validation
-        if position not in ('field', 'keeper'):
+        allowed = ALLOWED_EVENT_TYPES.get(position)
+        if allowed is None:
             flash('Invalid position', 'danger')
             return redirect(url_for('add_event'))
-        if position == 'field' and event_type not in OUTFIELD_TYPES:
-            flash('Invalid outfield event type', 'danger')
-            return redirect(url_for('add_event'))
-        if position == 'keeper' and event_type not in KEEPER_TYPES:
-            flash('Invalid keeper event type', 'danger')
+        if event_type not in allowed:
+            flash(f'Invalid {position} event type', 'danger')
             return redirect(url_for('add_event'))
 
         ev = Event(position=position, event_type=event_type, notes=notes,
                    on_target=on_target, scored=scored)
         db.session.add(ev)
+        if (position, event_type) in DailyStat.COUNTED_EVENTS:
+            today = datetime.utcnow().date()
+            day_stat = db.session.get(DailyStat, today) or DailyStat(date=today)
+            day_stat.record(position, event_type, scored)
+            db.session.add(day_stat)
         db.session.commit()
+        invalidate_stats_cache()
         flash('Event added!', 'success')
         return redirect(url_for('index'))
 
@@ -81,98 +265,102 @@ def add_event():
 
 # Stats page
 @app.route('/stats')
+@cache.cached(key_prefix='view/stats', unless=has_pending_flashes)
 def stats():
-    events = Event.query.all()
+    counts, on_target, scored = event_counts()
 
     # Outfield calculations
-    total_shots = sum(1 for e in events if e.position == 'field' and e.event_type == 'shot')
-    total_on_target = sum(1 for e in events if e.position == 'field' and e.event_type == 'shot' and e.on_target)
-    total_goals = sum(1 for e in events if e.position == 'field' and (e.event_type == 'goal' or (e.event_type == 'shot' and e.scored)))
-    total_assists = sum(1 for e in events if e.position == 'field' and e.event_type == 'assist')
-    total_passes = sum(1 for e in events if e.position == 'field' and e.event_type == 'pass')
+    total_shots = counts['field', 'shot']
+    total_on_target = on_target['field', 'shot']
+    total_goals = counts['field', 'goal'] + scored['field', 'shot']
+    total_assists = counts['field', 'assist']
+    total_passes = counts['field', 'pass']
 
     goal_percentage = (total_goals / total_shots * 100) if total_shots else None
     on_target_percentage = (total_on_target / total_shots * 100) if total_shots else None
 
     # Keeper calculations (shots on goal against, saves, save percentage)
-    shots_on_against = sum(1 for e in events if e.position == 'keeper' and e.event_type == 'shot_on_goal_against')
-    saves = sum(1 for e in events if e.position == 'keeper' and e.event_type == 'save')
-    conceded = sum(1 for e in events if e.position == 'keeper' and e.event_type == 'concede')
+    shots_on_against = counts['keeper', 'shot_on_goal_against']
+    saves = counts['keeper', 'save']
+    conceded = counts['keeper', 'concede']
 
     save_percentage = (saves / shots_on_against * 100) if shots_on_against else None
     goals_allowed = conceded
 
-    # Training goals progress
+    # Training goals progress; goals sharing a metric reuse its value (the cache lives for this request only)
+    @lru_cache(maxsize=None)
+    def metric_value(metric):
+        return compute_goal_progress(metric, None, counts)
+
     goals = TrainingGoal.query.all()
     goals_progress = []
     for g in goals:
-        prog = compute_goal_progress(g.metric, g.target, events)
-        goals_progress.append({'metric': g.metric, 'target': g.target, 'progress': prog})
+        goals_progress.append({'metric': g.metric, 'target': g.target, 'progress': metric_value(g.metric)})
 
-    # For charting we prepare small series
+    # For charting we prepare small series: goals and shots per date (YYYY-MM-DD), skipping keeper-only days
+    # SQLite formats the labels itself, so rows come back as plain (label, goals, shots) tuples
+    daily = db.session.query(func.strftime('%Y-%m-%d', DailyStat.date), DailyStat.goals, DailyStat.shots
+                             ).filter(or_(DailyStat.goals > 0, DailyStat.shots > 0)
+                             ).order_by(DailyStat.date).all()
     chart_data = {
-        'labels': [],
-        'goals': [],
-        'shots': []
+        'labels': [r[0] for r in daily],
+        'goals': [r[1] for r in daily],
+        'shots': [r[2] for r in daily]
+    }
+
+    stats = {
+        'total_shots': total_shots,
+        'total_on_target': total_on_target,
+        'total_goals': total_goals,
+        'total_assists': total_assists,
+        'total_passes': total_passes,
+        'goal_percentage': round(goal_percentage,2) if goal_percentage is not None else None,
+        'on_target_percentage': round(on_target_percentage,2) if on_target_percentage is not None else None,
+        'shots_on_against': shots_on_against,
+        'saves': saves,
+        'save_percentage': round(save_percentage,2) if save_percentage is not None else None,
+        'goals_allowed': goals_allowed,
+        'goals_progress': goals_progress,
+        'chart_data': chart_data,
     }
-    # simple time series by date (YYYY-MM-DD)
-    from collections import defaultdict
-    by_date = defaultdict(lambda: {'goals': 0, 'shots': 0})
-    for e in events:
-        day = e.timestamp.date().isoformat()
-        if e.position == 'field' and (e.event_type == 'goal' or (e.event_type=='shot' and e.scored)):
-            by_date[day]['goals'] += 1
-        if e.position == 'field' and e.event_type == 'shot':
-            by_date[day]['shots'] += 1
-    dates = sorted(by_date.keys())
-    chart_data['labels'] = dates
-    chart_data['goals'] = [by_date[d]['goals'] for d in dates]
-    chart_data['shots'] = [by_date[d]['shots'] for d in dates]
-
-    return render_template('stats.html',
-                           total_shots=total_shots,
-                           total_on_target=total_on_target,
-                           total_goals=total_goals,
-                           total_assists=total_assists,
-                           total_passes=total_passes,
-                           goal_percentage=round(goal_percentage,2) if goal_percentage is not None else None,
-                           on_target_percentage=round(on_target_percentage,2) if on_target_percentage is not None else None,
-                           shots_on_against=shots_on_against,
-                           saves=saves,
-                           save_percentage=round(save_percentage,2) if save_percentage is not None else None,
-                           goals_allowed=goals_allowed,
-                           goals_progress=goals_progress,
-                           chart_data=chart_data
-                           )
-
-def compute_goal_progress(metric, target, events):
+    return render_template('stats.html', stats=stats)
+
+def compute_goal_progress(metric, target, counts):
     """
     A simple function that interprets a metric string and computes progress value.
+    `counts` is the per-(position, event_type) Counter returned by event_counts().
     Supported metrics (examples):
       - goals_per_week
       - save_percentage
       - shots_per_training
     Returns a value that indicates current measured value (not percent complete).
     """
-    from collections import defaultdict
     if metric == 'goals_per_week':
         # count goals in last 7 days
-        cutoff = datetime.utcnow().date()
-        last7 = [e for e in events if e.position == 'field' and (e.event_type == 'goal' or (e.event_type=='shot' and e.scored)) and (e.timestamp.date() >= (cutoff))]
-        # Note: simple placeholder — you can replace with real date range logic
-        return len(last7)
+        cutoff = datetime.utcnow() - timedelta(days=7)
+        return db.session.query(func.count()).filter(IS_FIELD_GOAL, Event.timestamp >= cutoff).scalar()
     if metric == 'save_percentage':
-        shots_on = sum(1 for e in events if e.position=='keeper' and e.event_type=='shot_on_goal_against')
-        saves = sum(1 for e in events if e.position=='keeper' and e.event_type=='save')
+        shots_on = counts['keeper', 'shot_on_goal_against']
+        saves = counts['keeper', 'save']
         return (saves / shots_on * 100) if shots_on else None
     if metric == 'shots_per_training':
         # naive average: total shots / number of sessions (not implemented: sessions)
-        total_shots = sum(1 for e in events if e.position=='field' and e.event_type=='shot')
+        total_shots = counts['field', 'shot']
         # no session table, so we return total shots as fallback
         return total_shots
     # if unknown metric, return None
     return None
 
+# Training goals change rarely, so the list is cached and cleared on every goal write.
+# Plain rows are cached rather than TrainingGoal objects so they pickle cleanly for any cache backend.
+GOALS_CACHE_KEY = 'goals_list'
+
+@cache.cached(timeout=300, key_prefix=GOALS_CACHE_KEY)
+def goals_list():
+    return TrainingGoal.query.with_entities(TrainingGoal.id, TrainingGoal.metric, TrainingGoal.target,
+                                            TrainingGoal.created_at
+                                            ).order_by(TrainingGoal.created_at.desc()).all()
+
 # Add / Remove training goals
 @app.route('/goals', methods=['GET', 'POST'])
 def goals():
@@ -186,39 +374,54 @@ def goals():
         g = TrainingGoal(metric=metric, target=target)
         db.session.add(g)
         db.session.commit()
+        invalidate_stats_cache()
+        cache.delete(GOALS_CACHE_KEY)
         flash('Training goal added', 'success')
         return redirect(url_for('goals'))
-    goals = TrainingGoal.query.order_by(TrainingGoal.created_at.desc()).all()
-    return render_template('goals.html', goals=goals)
+    return render_template('goals.html', goals=goals_list())
 
 @app.route('/goal/delete/<int:goal_id>', methods=['POST'])
 def delete_goal(goal_id):
     g = TrainingGoal.query.get_or_404(goal_id)
     db.session.delete(g)
     db.session.commit()
+    invalidate_stats_cache()
+    cache.delete(GOALS_CACHE_KEY)
     flash('Goal removed', 'info')
     return redirect(url_for('goals'))
 
 # API endpoint to fetch raw stats as JSON (useful for mobile or automation)
 @app.route('/api/stats')
+@cache.cached(key_prefix='view/api_stats')
 def api_stats():
-    events = Event.query.all()
-    stats = {
-        'total_shots': sum(1 for e in events if e.position == 'field' and e.event_type == 'shot'),
-        'total_goals': sum(1 for e in events if e.position == 'field' and (e.event_type == 'goal' or (e.event_type == 'shot' and e.scored))),
-        'total_assists': sum(1 for e in events if e.position == 'field' and e.event_type == 'assist'),
-        'keeper_saves': sum(1 for e in events if e.position == 'keeper' and e.event_type=='save'),
-    }
-    return jsonify(stats)
+    # COUNT() skips the NULLs from unmatched CASE branches, so each column counts its own condition
+    row = db.session.query(
+        func.count(case((IS_FIELD_SHOT, 1))).label('total_shots'),
+        func.count(case((IS_FIELD_GOAL, 1))).label('total_goals'),
+        func.count(case((IS_FIELD_ASSIST, 1))).label('total_assists'),
+        func.count(case((IS_KEEPER_SAVE, 1))).label('keeper_saves'),
+    ).one()
+    stats = row._asdict()
+    return app.response_class(orjson.dumps(stats), mimetype='application/json')
 
 # small helper to clear all events (for testing) -- you can remove in production
 @app.route('/admin/clear', methods=['POST'])
 def admin_clear():
-    Event.query.delete()
-    TrainingGoal.query.delete()
+    db.session.execute(delete(Event))
+    db.session.execute(delete(TrainingGoal))
+    db.session.execute(delete(DailyStat))
     db.session.commit()
+    invalidate_stats_cache()
+    cache.delete(GOALS_CACHE_KEY)
     flash('All data cleared (admin)', 'warning')
     return redirect(url_for('index'))
 
+# Set up the database at import time rather than on the first request, so no request pays for it
+# and every worker process is ready as soon as it starts
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
+    create_tables()
+
 if __name__ == '__main__':
     app.run(debug=True)